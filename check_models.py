@@ -1,7 +1,13 @@
 import os
-import json
-import urllib.request
-import urllib.error
+
+import urllib3
+import orjson
+
+# Shared connection pool so repeated invocations within one process reuse
+# the same keep-alive connection (see gemini_chat.py / llamacpp_chat.py);
+# gzip responses are decoded transparently by urllib3
+POOL = urllib3.PoolManager(num_pools=4, maxsize=4,
+                           headers={"Accept-Encoding": "gzip"})
 
 def list_available_models(api_key):
     """
@@ -13,36 +19,34 @@ def list_available_models(api_key):
     print(f"正在向以下地址发出请求: {url}")
 
     try:
-        # This is a GET request, so no data or method needs to be specified in the Request object
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req) as response:
-            if response.status == 200:
-                response_body = response.read().decode("utf-8")
-                data = json.loads(response_body)
+        response = POOL.request("GET", url)
+        if response.status == 200:
+            data = orjson.loads(response.data)
+
+            # Dumping the entire listing (~40 models with long descriptions)
+            # is pure diagnostics; only pay for it when explicitly requested
+            if os.getenv("DEBUG"):
                 print("\n--- 可用的模型列表 ---")
-                # Pretty print the JSON for better readability
-                print(json.dumps(data, indent=2))
+                print(orjson.dumps(data, option=orjson.OPT_INDENT_2).decode("utf-8"))
                 print("\n--------------------------")
 
-                # Extract and suggest a model to use
-                if 'models' in data and data['models']:
-                    # Find a model that supports 'generateContent'
-                    for model in data['models']:
-                        if 'generateContent' in model.get('supportedGenerationMethods', []):
-                            print(f"\n建议: 您可以尝试使用这个模型名称: '{model['name']}'")
-                            # It returns 'models/gemini-1.0-pro', we need just 'gemini-1.0-pro'
-                            model_id = model['name'].split('/')[-1]
-                            print(f"在我们的脚本中，这意味着将 model_name 设置为: '{model_id}'")
-                            return
-                    print("\n警告: 找到了模型，但似乎没有一个明确支持 'generateContent'。")
-
-            else:
-                print(f"请求失败，HTTP 状态码: {response.status}")
-                print(response.read().decode("utf-8"))
-
-    except urllib.error.HTTPError as e:
-        print(f"API 请求失败，HTTP 状态码: {e.code}")
-        print(f"错误详情: {e.read().decode('utf-8')}")
+            # Single pass with short-circuit: stop at the first model that
+            # supports 'generateContent'
+            chosen = next((m for m in data.get('models', ())
+                           if 'generateContent' in m.get('supportedGenerationMethods', ())), None)
+            if chosen is not None:
+                print(f"\n建议: 您可以尝试使用这个模型名称: '{chosen['name']}'")
+                # It returns 'models/gemini-1.0-pro', we need just 'gemini-1.0-pro'
+                model_id = chosen['name'].split('/')[-1]
+                print(f"在我们的脚本中，这意味着将 model_name 设置为: '{model_id}'")
+                return
+            if data.get('models'):
+                print("\n警告: 找到了模型，但似乎没有一个明确支持 'generateContent'。")
+
+        else:
+            print(f"请求失败，HTTP 状态码: {response.status}")
+            print(response.data.decode("utf-8"))
+
     except Exception as e:
         print(f"发生未知错误: {e}")
 
@@ -11,83 +11,277 @@
 #
 # 要求:
 # - Python 3.x
-# - 无任何第三方库依赖。
+# - 第三方库依赖: httpx[http2], orjson, ijson, aiofiles
+#   (pip install "httpx[http2]" orjson ijson aiofiles)
 # - 需要在环境变量中设置 GEMINI_API_KEY。
 # -----------------------------------------------------------------------------
 
 import os
-import json
-import urllib.request
-import urllib.error
+import io
+import re
+import gzip
+import random
+import hashlib
+import asyncio
+import functools
+import collections
 from datetime import datetime
 
-def get_gemini_response(api_key, history, model="gemini-pro"):
+import httpx
+import aiofiles
+import orjson
+import ijson
+
+# 每多少轮对话强制将日志刷到磁盘一次；
+# 相比每条回复都刷盘，批量刷新能明显减少 I/O 压力
+_FLUSH_EVERY = 8
+
+# 响应体超过该大小时改用增量解析（边下载边解析），
+# 小响应仍走"整体读入 + orjson"的快路径
+_STREAM_PARSE_MIN = 64 * 1024
+
+class _AsyncByteReader:
+    """
+    把 httpx 的异步字节流适配成 ijson 需要的 async read(n) 接口。
+    """
+
+    def __init__(self, aiterator):
+        self._it = aiterator
+        self._buf = bytearray()
+        self._done = False
+
+    async def read(self, n=-1):
+        while not self._done and (n < 0 or len(self._buf) < n):
+            try:
+                self._buf += await self._it.__anext__()
+            except StopAsyncIteration:
+                self._done = True
+        if n < 0:
+            out = bytes(self._buf)
+            self._buf.clear()
+        else:
+            out = bytes(self._buf[:n])
+            del self._buf[:n]
+        return out
+
+# 瞬时故障的重试参数：这些状态码（限流/服务端错误）值得退避后再试
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+_MAX_ATTEMPTS = 5
+
+# 拒绝用语的匹配模式：只编译一次，单遍扫描即可完成检查，
+# 不必先复制一份去掉换行的字符串；\s* 还能容忍模型在
+# 三个"不同意"之间插入空格或换行的各种写法
+_REJECT_RE = re.compile(r"不同意\s*不同意\s*不同意")
+
+def _rejected(resp):
+    """
+    判断一次同意询问是否应视为拒绝：
+    回应缺失（API 失败）和明确的三连"不同意"走同一条终止路径。
+    """
+    return resp is None or _REJECT_RE.search(resp) is not None
+
+# 滑动窗口大小：每次请求最多携带最近多少条消息（外加被固定保留的开场白）。
+# 不加限制的话，到第 100 轮时每次请求要携带约 200 条历史消息，
+# 请求体大小和服务端注意力开销都随对话长度二次增长。
+# 历史用 deque(maxlen=MAX_TURNS) 存放，截断由 deque 自动完成，内存也随之封顶
+MAX_TURNS = 16
+
+# 精确匹配的回复缓存：键为 (模型, 请求体) 的 SHA-256 哈希。
+# 当两个 AI 的对话偶然收敛到完全相同的历史时（例如一方开始复读），
+# 直接返回缓存的回复，省掉一次完整的 API 往返
+_resp_cache = {}
+
+def _cache_key(model, body):
+    """
+    由模型名和已序列化的请求体计算缓存键（SHA-256）。
+    """
+    return hashlib.sha256(model.encode("utf-8") + b"\x00" + body).digest()
+
+# 请求头在整个运行期间不变，构建一次即可。
+# Accept-Encoding: gzip 让服务端压缩响应（httpx 收到后自动解压）
+_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept-Encoding": "gzip",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# 请求体超过该大小时在发送前做 gzip 压缩。
+# 只有携带完整对话记录的总结请求会达到这个量级；
+# AI 闲聊文本的压缩比通常有 5-10 倍，在慢速链路上收益明显
+_GZIP_MIN = 16 * 1024
+
+def _to_gemini(role, text):
+    """
+    把内部格式的一条消息转换为 Gemini API 'contents' 所需的格式。
+
+    --- Gemini API 的角色参数说明 ---
+    'role' 用于区分对话历史中的发言者，是模型理解上下文的关键。
+    API接受两个主要的角色值:
+    - 'user': 代表向模型提问或发出指令的一方。在我们的脚本里，当一个AI接收另一个AI的消息时，该消息就被视为'user'角色。
+    - 'model': 代表模型自身。模型之前的回复会被标记为'model'角色，以便它知道自己说过什么。
+    (我们的内部角色 'assistant' 在这里被统一映射为 API 的 'model' 角色)
+    """
+    return {"role": "model" if role == "assistant" else "user", "parts": [{"text": text}]}
+
+def _remember(head, parts, role, text):
+    """
+    把一条新消息并入某个 AI 的历史：转换并序列化恰好一次。
+    第一条消息（开场白/语境）固定保留在 head，其余进入滑动窗口 parts，
+    deque 的 maxlen 会自动淘汰最旧的消息。
+    """
+    msg_json = orjson.dumps(_to_gemini(role, text))
+    if head:
+        parts.append(msg_json)
+    else:
+        head.append(msg_json)
+
+def _frame_contents(head, parts):
+    """
+    由预序列化的消息字节片段直接拼出请求体，
+    免去每次请求对整个历史前缀的重复 JSON 编码。
+
+    窗口填满后，开场白与窗口首条消息可能角色相同
+    （Gemini v1beta 要求多轮 contents 严格 user/model 交替，
+    否则返回不可重试的 400），此时丢弃窗口的第一条消息。
+    角色通过序列化片段的前缀比较：_to_gemini 固定把 "role" 放在首位。
     """
-    使用 Python 内置库直接调用 Google Gemini API 并获取回复。
+    merged = [*head, *parts]
+    if len(merged) > 1 and merged[0][:15] == merged[1][:15]:
+        del merged[1]
+    return b'{"contents":[' + b",".join(merged) + b"]}"
+
+@functools.lru_cache(maxsize=None)
+def _api_url(model, api_key, stream):
+    """
+    构建并缓存请求 URL：model/api_key 在一次运行中固定，
+    没必要每次调用都重新拼接格式化字符串。
+    """
+    if stream:
+        return f"https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
+    return f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
+
+async def get_gemini_response(client, api_key, body, model="gemini-pro", no_cache=False, stream=True):
+    """
+    通过共享的 httpx 客户端异步调用 Google Gemini API 并获取回复。
 
     Args:
+        client (httpx.AsyncClient): 整个程序共用的 HTTP/2 客户端。
+            多个并发请求（同意探测、多后端扇出、总结）在同一条
+            TCP+TLS 连接上以 HTTP/2 流的形式复用，握手只付一次。
         api_key (str): 您的 Google API 密钥。
-        history (list): 对话历史记录，一个包含消息字典的列表。
+        body (bytes): 已序列化的请求体（由 _frame_contents 拼装，
+            每条消息只在进入历史时编码一次，由调用方增量维护）。
         model (str): 要使用的 Gemini 模型名称。
+        no_cache (bool): 为 True 时绕过回复缓存（例如总结调用，避免拿到旧总结）。
+        stream (bool): 为 True 时走 streamGenerateContent 的 SSE 流式接口，
+            token 边生成边接收，不必等服务端生成完整个回复；
+            为 False 时走一次性的 generateContent（总结调用使用）。
 
     Returns:
         str: 来自 API 的文本回复内容。如果出错或被拦截，则返回 None。
     """
-    # 构建请求 URL，API Key 作为查询参数传入
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
-    
-    # 准备请求头，包含内容类型和模拟浏览器的 User-Agent
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-
-    # -- 将我们内部的 history 格式转换为 Gemini API 需要的 'contents' 格式 --
-    gemini_history = []
-    for message in history:
-        # --- Gemini API 的角色参数说明 ---
-        # 'role' 用于区分对话历史中的发言者，是模型理解上下文的关键。
-        # API接受两个主要的角色值:
-        # - 'user': 代表向模型提问或发出指令的一方。在我们的脚本里，当一个AI接收另一个AI的消息时，该消息就被视为'user'角色。
-        # - 'model': 代表模型自身。模型之前的回复会被标记为'model'角色，以便它知道自己说过什么。
-        # (我们的内部角色 'assistant' 在这里被统一映射为 API 的 'model' 角色)
-        role = "model" if message["role"] == "assistant" else "user"
-        gemini_history.append({"role": role, "parts": [{"text": message["content"]}]})
-
-    # 准备请求体 (payload)
-    payload = {"contents": gemini_history}
-    
-    # 将 Python 字典转换为 JSON 格式的字节串
-    json_data = json.dumps(payload).encode("utf-8")
-    
-    # 创建一个完整的请求对象
-    req = urllib.request.Request(api_url, data=json_data, headers=headers, method="POST")
-
-    try:
-        # 发送请求并等待响应
-        with urllib.request.urlopen(req) as response:
-            response_body = response.read().decode("utf-8")
-            response_json = json.loads(response_body)
-            
-            # 健壮性检查：如果响应中没有 'candidates' 字段，说明可能被安全策略拦截
-            if "candidates" not in response_json:
-                print("\n[系统警告] API 响应中没有 'candidates'，可能内容被安全策略拦截。\n")
-                return None
-            
-            # 提取并返回模型生成的文本内容
-            message_content = response_json["candidates"][0]["content"]["parts"][0]["text"]
-            return message_content
-            
-    # 异常处理：处理 HTTP 错误（如 404, 500 等）
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode("utf-8")
-        print(f"\n[错误] API 请求失败，HTTP 状态码: {e.code}\n")
-        print(f"错误详情: {error_body}\n")
-        return None
-    # 异常处理：处理其他所有错误（如网络连接问题、SSL错误等）
-    except Exception as e:
-        print(f"\n[错误] 发生未知错误: {e}\n")
-        return None
+    # 先查缓存：完全相同的 (模型, 请求体) 不必重复请求
+    if not no_cache:
+        key = _cache_key(model, body)
+        cached = _resp_cache.get(key)
+        if cached is not None:
+            return cached
+    # 请求 URL（API Key 作为查询参数传入）只在首次调用时拼接，之后直接复用
+    api_url = _api_url(model, api_key, stream)
+
+    # 大请求体（总结调用）压缩后再上传。保留原始 body：
+    # 若服务端不接受 gzip 请求体（返回 4xx），可回退为未压缩重发
+    send_body, headers = body, _HEADERS
+    if len(body) > _GZIP_MIN:
+        send_body = gzip.compress(body)
+        headers = {**_HEADERS, "Content-Encoding": "gzip"}
+
+    # 瞬时故障（限流、服务端错误、网络抖动）用指数退避 + 抖动重试：
+    # 失败一次就放弃会让后续轮次拿占位符继续，等于浪费剩余的全部额度
+    for attempt in range(_MAX_ATTEMPTS):
+        try:
+            # 发送请求并以流的方式收取响应（不会阻塞事件循环，其他任务可以同时进行）
+            async with client.stream("POST", api_url, content=send_body, headers=headers) as response:
+                if response.status_code != 200:
+                    error_body = (await response.aread()).decode("utf-8", "replace")
+                    if response.status_code in _RETRY_STATUS and attempt < _MAX_ATTEMPTS - 1:
+                        delay = 2 ** attempt + random.random()
+                        print(f"[系统] API 返回 {response.status_code}，{delay:.1f} 秒后重试 "
+                              f"({attempt + 1}/{_MAX_ATTEMPTS})...")
+                        await asyncio.sleep(delay)
+                        continue
+                    # 4xx 且请求体是压缩过的：可能是服务端不接受
+                    # gzip 请求体，立即改用未压缩的原始 body 重发一次
+                    if (400 <= response.status_code < 500
+                            and "Content-Encoding" in headers
+                            and attempt < _MAX_ATTEMPTS - 1):
+                        print(f"[系统] API 返回 {response.status_code}，"
+                              "改用未压缩请求体重试...")
+                        send_body, headers = body, _HEADERS
+                        continue
+                    print(f"\n[错误] API 请求失败，HTTP 状态码: {response.status_code}\n")
+                    print(f"错误详情: {error_body}\n")
+                    return None
+
+                content_length = int(response.headers.get("Content-Length", 0))
+
+                if stream:
+                    # SSE 流式响应：每行 "data: {...}" 携带一小段增量文本，
+                    # 逐行拼接即可在生成过程中同步收取回复
+                    pieces = []
+                    async for line in response.aiter_lines():
+                        line = line.strip()
+                        if not line.startswith("data: "):
+                            continue
+                        chunk = orjson.loads(line[6:])
+                        candidates = chunk.get("candidates")
+                        if not candidates:
+                            continue
+                        for part in candidates[0].get("content", {}).get("parts", ()):
+                            pieces.append(part.get("text", ""))
+                    if not pieces:
+                        print("\n[系统警告] API 响应中没有 'candidates'，可能内容被安全策略拦截。\n")
+                        return None
+                    message_content = "".join(pieces)
+                elif content_length > _STREAM_PARSE_MIN:
+                    # 大响应体（例如总结调用）：用 ijson 对字节流做增量解析，
+                    # 下载和解析重叠进行，不必等整个响应体落地再一次性 loads
+                    message_content = None
+                    reader = _AsyncByteReader(response.aiter_bytes())
+                    async for text in ijson.items_async(
+                            reader, "candidates.item.content.parts.item.text"):
+                        message_content = text
+                        break
+                    if message_content is None:
+                        print("\n[系统警告] API 响应中没有 'candidates'，可能内容被安全策略拦截。\n")
+                        return None
+                else:
+                    response_json = orjson.loads(await response.aread())
+
+                    # 健壮性检查：如果响应中没有 'candidates' 字段，说明可能被安全策略拦截
+                    if "candidates" not in response_json:
+                        print("\n[系统警告] API 响应中没有 'candidates'，可能内容被安全策略拦截。\n")
+                        return None
+
+                    # 提取模型生成的文本内容
+                    message_content = response_json["candidates"][0]["content"]["parts"][0]["text"]
+
+                if not no_cache:
+                    _resp_cache[key] = message_content
+                return message_content
+
+        # 异常处理：处理所有网络层错误（如连接失败、超时、SSL错误等）
+        except Exception as e:
+            if attempt < _MAX_ATTEMPTS - 1:
+                delay = 2 ** attempt + random.random()
+                print(f"[系统] 请求异常 ({e})，{delay:.1f} 秒后重试 "
+                      f"({attempt + 1}/{_MAX_ATTEMPTS})...")
+                await asyncio.sleep(delay)
+                continue
+            print(f"\n[错误] 发生未知错误: {e}\n")
+            return None
+
+    return None
 
 def print_message(speaker, message):
     """
@@ -97,7 +291,17 @@ def print_message(speaker, message):
     print(message)
     print("-" * 35)
 
-def main():
+async def _append_log(log_fh, transcript_buf, text):
+    """
+    向日志文件和内存中的对话副本追加同一段文本。
+    文件句柄全程只打开一次，省去每轮 open/close 的系统调用；
+    内存副本用于总结阶段，避免再从磁盘读回整个日志。
+    aiofiles 在内部线程池执行磁盘写入，不会阻塞事件循环。
+    """
+    await log_fh.write(text)
+    transcript_buf.write(text)
+
+async def main():
     """
     主函数，驱动整个流程：获取同意 -> 循环对话 -> 保存记录 -> 生成总结。
     """
@@ -114,103 +318,128 @@ def main():
     conversation_rounds = 100
     # -------------------------
 
-    history_a, history_b = [], []
+    # 每个 AI 的历史由两部分组成：固定保留的开场白 (head) 和
+    # 最近消息的滑动窗口 (parts)。消息在进入历史时就被序列化为字节片段，
+    # 发送时直接拼接，既不重复编码前缀，内存也被 deque 的 maxlen 封顶
+    head_a, parts_a = [], collections.deque(maxlen=MAX_TURNS)
+    head_b, parts_b = [], collections.deque(maxlen=MAX_TURNS)
     output_dir = "output"
-    
-    # --- 2. 知情同意阶段 ---
-    print("\n[系统] 正在请求 AI 同意...\n")
-    consent_prompt = f"系统指令：你将与另一个AI进行对话，你们的对话内容会被我记录下来。对话将进行 {conversation_rounds} 轮。由于我的API有使用限额，因此对话轮次有限。如果你同意，请回复“我同意”；如果你不同意，请连续回复三次“不同意”。"
-    rejection_phrase = "不同意不同意不同意"
-
-    # 检查 AI A 是否同意
-    consent_response_a = get_gemini_response(api_key, [{"role": "user", "content": consent_prompt}], model_name)
-    if consent_response_a is None:
-        print("[系统] 因API请求失败，无法获取 AI A 的回应，程序终止。\n")
-        return
-    if rejection_phrase in consent_response_a.replace("\n", ""):
-        print("[系统] AI A 不同意进行对话，程序终止。\n")
-        return
-    print("[系统] AI A 已同意参与对话。\n")
 
-    # 检查 AI B 是否同意
-    consent_response_b = get_gemini_response(api_key, [{"role": "user", "content": consent_prompt}], model_name)
-    if consent_response_b is None:
-        print("[系统] 因API请求失败，无法获取 AI B 的回应，程序终止。\n")
-        return
-    if rejection_phrase in consent_response_b.replace("\n", ""):
-        print("[系统] AI B 不同意进行对话，程序终止。\n")
-        return
-    
-    print("[系统] 双方均已同意，对话即将开始...\n")
-
-    # --- 3. 准备日志文件 (在同意后) ---
-    try:
-        os.makedirs(output_dir, exist_ok=True)
-        log_filename = os.path.join(output_dir, "conversation_log.md")
-        # 'w'模式会覆盖旧文件，确保每次运行都是一个新日志
-        with open(log_filename, "w", encoding="utf-8") as f:
-            f.write(f"# 完整对话记录\n\n**生成时间:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n---\n\n")
-    except OSError as e:
-        print(f"[错误] 准备日志文件时出错: {e}\n")
-        return
+    # 整个程序共用一个 HTTP/2 客户端：所有请求（包括并发的同意探测）
+    # 在同一条 TCP+TLS 连接上以多路复用的流承载，握手开销只付一次
+    async with httpx.AsyncClient(http2=True, timeout=60.0) as client:
+        # --- 2. 知情同意阶段 ---
+        print("\n[系统] 正在请求 AI 同意...\n")
+        consent_prompt = f"系统指令：你将与另一个AI进行对话，你们的对话内容会被我记录下来。对话将进行 {conversation_rounds} 轮。由于我的API有使用限额，因此对话轮次有限。如果你同意，请回复“我同意”；如果你不同意，请连续回复三次“不同意”。"
 
-    # --- 4. 正式对话阶段 ---
-    print(f"\n模型 '{model_name}' 初始化，对话开始...\n\n")
-    current_message = initial_prompt
-    # 仅在终端显示开场白，让用户知道对话已启动
-    print_message("AI A (开场白)", current_message)
-    history_a.append({"role": "assistant", "content": current_message})
-    # 实时写入开场白
-    with open(log_filename, "a", encoding="utf-8") as f:
-        f.write(f"**AI A:**\n\n{current_message}\n\n---\n")
-
-    # 主对话循环
-    for i in range(conversation_rounds):
-        # 在终端打印当前轮数
-        print(f"--- 对话轮次: {i + 1}/{conversation_rounds} ---")
-        
-        # AI B 的回合
-        history_b.append({"role": "user", "content": current_message})
-        message_b = get_gemini_response(api_key, history_b, model=model_name)
-        if not message_b:
-            print_message("系统", "AI B 未能生成有效回复，将使用占位符继续...")
-            message_b = "(无有效回复)"
-        
-        history_b.append({"role": "assistant", "content": message_b})
-        # 实时写入 AI B 的回复
-        with open(log_filename, "a", encoding="utf-8") as f:
-            f.write(f"**AI B:**\n\n{message_b}\n\n---\n")
-
-        # AI A 的回合
-        history_a.append({"role": "user", "content": message_b})
-        message_a = get_gemini_response(api_key, history_a, model=model_name)
-        if not message_a:
-            print_message("系统", "AI A 未能生成有效回复，将使用占位符继续...")
-            message_a = "(无有效回复)"
-
-        history_a.append({"role": "assistant", "content": message_a})
-        # 实时写入 AI A 的回复
-        with open(log_filename, "a", encoding="utf-8") as f:
-            f.write(f"**AI A:**\n\n{message_a}\n\n---\n")
-
-        current_message = message_a
-
-    print("\n对话结束。\n")
-    print(f"[系统] 完整对话记录已实时保存到: {log_filename}\n")
-
-    # --- 5. 生成并保存总结 ---
-    print("[系统] 正在生成对话总结...\n")
-    try:
-        # 读取刚刚保存的完整对话记录，用于生成摘要
-        with open(log_filename, "r", encoding="utf-8") as f:
-            full_transcript_text = f.read()
-    except FileNotFoundError:
-        print("[错误] 找不到日志文件，无法生成摘要。\n")
-        return
+        # 两个同意询问彼此独立，用 asyncio.gather 并发发出，耗时约为串行的一半。
+        # 两次询问请求体完全相同，必须绕过缓存，
+        # 否则第二个 AI 拿到的可能是第一个 AI 回答的缓存副本
+        consent_body = _frame_contents([orjson.dumps(_to_gemini("user", consent_prompt))], ())
+        consent_response_a, consent_response_b = await asyncio.gather(
+            get_gemini_response(client, api_key, consent_body, model_name, no_cache=True),
+            get_gemini_response(client, api_key, consent_body, model_name, no_cache=True),
+        )
+
+        # 检查 AI A 是否同意（回应缺失与明确拒绝合并为同一个判断）
+        if _rejected(consent_response_a):
+            print("[系统] AI A 未同意对话（拒绝或未能回应），程序终止。\n")
+            return
+        print("[系统] AI A 已同意参与对话。\n")
+
+        # 检查 AI B 是否同意
+        if _rejected(consent_response_b):
+            print("[系统] AI B 未同意对话（拒绝或未能回应），程序终止。\n")
+            return
+
+        print("[系统] 双方均已同意，对话即将开始...\n")
+
+        # --- 3. 准备日志文件 (在同意后) ---
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            log_filename = os.path.join(output_dir, "conversation_log.md")
+            # 'w'模式会覆盖旧文件，确保每次运行都是一个新日志；
+            # aiofiles 让写入在后台线程执行，每 _FLUSH_EVERY 轮统一刷盘一次
+            log_fh = await aiofiles.open(log_filename, "w", encoding="utf-8")
+            # 内存中的对话副本，总结阶段直接取用，无需重新读文件
+            transcript_buf = io.StringIO()
+            await _append_log(log_fh, transcript_buf,
+                              f"# 完整对话记录\n\n**生成时间:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n---\n\n")
+        except OSError as e:
+            print(f"[错误] 准备日志文件时出错: {e}\n")
+            return
+
+        # --- 4. 正式对话阶段 ---
+        print(f"\n模型 '{model_name}' 初始化，对话开始...\n\n")
+        current_message = initial_prompt
+        # 仅在终端显示开场白，让用户知道对话已启动
+        print_message("AI A (开场白)", current_message)
+        _remember(head_a, parts_a, "assistant", current_message)
+        # 实时写入开场白
+        await _append_log(log_fh, transcript_buf, f"**AI A:**\n\n{current_message}\n\n---\n")
+
+        # 日志写入任务：磁盘写入放到后台，与下一次模型调用重叠进行。
+        # 每次创建新任务前先等待上一个任务完成，保证日志按顺序追加。
+        log_task = None
+
+        # 主对话循环
+        for i in range(conversation_rounds):
+            # 在终端打印当前轮数
+            print(f"--- 对话轮次: {i + 1}/{conversation_rounds} ---")
+
+            # AI B 的回合
+            _remember(head_b, parts_b, "user", current_message)
+            message_b = await get_gemini_response(
+                client, api_key, _frame_contents(head_b, parts_b), model=model_name)
+            if not message_b:
+                print_message("系统", "AI B 未能生成有效回复，将使用占位符继续...")
+                message_b = "(无有效回复)"
+
+            _remember(head_b, parts_b, "assistant", message_b)
+
+            # AI A 的回合
+            _remember(head_a, parts_a, "user", message_b)
+            message_a = await get_gemini_response(
+                client, api_key, _frame_contents(head_a, parts_a), model=model_name)
+            if not message_a:
+                print_message("系统", "AI A 未能生成有效回复，将使用占位符继续...")
+                message_a = "(无有效回复)"
+
+            _remember(head_a, parts_a, "assistant", message_a)
+
+            # 一轮的两条回复合并成一次写入（后台进行，与下一轮的请求重叠）
+            if log_task:
+                await log_task
+            log_task = asyncio.create_task(
+                _append_log(log_fh, transcript_buf,
+                            f"**AI B:**\n\n{message_b}\n\n---\n"
+                            f"**AI A:**\n\n{message_a}\n\n---\n"))
+
+            # 每 _FLUSH_EVERY 轮把缓冲的日志统一刷到磁盘
+            if (i + 1) % _FLUSH_EVERY == 0:
+                await log_task
+                log_task = None
+                await log_fh.flush()
+
+            current_message = message_a
+
+        # 确保最后一条日志已落盘，再进入总结阶段
+        if log_task:
+            await log_task
+        await log_fh.close()
+
+        print("\n对话结束。\n")
+        print(f"[系统] 完整对话记录已实时保存到: {log_filename}\n")
+
+        # --- 5. 生成并保存总结 ---
+        print("[系统] 正在生成对话总结...\n")
+        # 完整对话在写日志时已同步保存在内存里，直接取用即可
+        full_transcript_text = transcript_buf.getvalue()
 
-    summary_prompt = f"请将以下两位AI的对话内容，归纳成一份重点明确、格式清晰的 Markdown 摘要。{full_transcript_text}"
-    summary_history = [{"role": "user", "content": summary_prompt}]
-    summary = get_gemini_response(api_key, summary_history, model=model_name)
+        summary_prompt = f"请将以下两位AI的对话内容，归纳成一份重点明确、格式清晰的 Markdown 摘要。{full_transcript_text}"
+        summary_body = _frame_contents([orjson.dumps(_to_gemini("user", summary_prompt))], ())
+        summary = await get_gemini_response(client, api_key, summary_body, model=model_name,
+                                            no_cache=True, stream=False)
 
     if summary:
         try:
@@ -226,5 +455,4 @@ def main():
 
 # 当该脚本被直接执行时，运行 main 函数
 if __name__ == "__main__":
-    main()
-    
\ No newline at end of file
+    asyncio.run(main())
@@ -4,25 +4,162 @@
 #
 # 说明:
 # - 使用 llama.cpp 自带的 OpenAI-compatible HTTP server
-# - 不依赖任何第三方库
+# - 第三方库依赖: urllib3, orjson (pip install urllib3 orjson)
 # - 完全本地运行
 # -----------------------------------------------------------------------------
 
 import os
-import json
-import urllib.request
-import urllib.error
+import io
+import re
+import math
+import hashlib
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+import orjson
 
 LLAMA_API_URL = "http://127.0.0.1:1234/v1/chat/completions"
+LLAMA_EMBED_URL = "http://127.0.0.1:1234/v1/embeddings"
+
+# 语义缓存的相似度阈值：最近的对话上下文与缓存条目的余弦相似度
+# 超过该值时视为"换了个说法的同一个问题"，直接复用缓存回复
+SEMANTIC_THRESHOLD = 0.92
+
+# 语义缓存生效所需的最小历史长度：开场白要求对方逐字复读，
+# 头几轮的消息彼此高度相似，语义缓存几乎必然误命中并让对话
+# 塌缩成同一条缓存回复，因此前几轮只走精确缓存
+_SEM_MIN_HISTORY = 5
+
+# 拒绝用语的匹配模式：只编译一次，单遍扫描即可完成检查，
+# \s* 容忍模型在三个"不同意"之间插入空格或换行（参见 gemini_chat.py）
+_REJECT_RE = re.compile(r"不同意\s*不同意\s*不同意")
 
-def get_llama_response(history, model="local-model"):
+def _rejected(resp):
+    """
+    回应缺失（请求失败）或包含三连"不同意"时视为拒绝。
+    """
+    return not resp or _REJECT_RE.search(resp) is not None
+
+# 滑动窗口大小：每次请求最多携带最近多少条消息（外加固定保留的开场白），
+# 避免请求体随对话轮数线性膨胀（参见 gemini_chat.py）
+MAX_TURNS = 16
+
+def _windowed(history):
+    if len(history) <= MAX_TURNS + 1:
+        return history
+    window = history[-MAX_TURNS:]
+    # 开场白与窗口首条消息角色相同时丢弃后者，
+    # 保持 user/assistant 严格交替（参见 gemini_chat.py）
+    if window[0]["role"] == history[0]["role"]:
+        window = window[1:]
+    return history[:1] + window
+
+# 精确匹配的回复缓存：键为 (模型, 对话历史) 的 SHA-256 哈希，
+# 命中时直接返回缓存回复，省掉一次推理（参见 gemini_chat.py）
+_resp_cache = {}
+
+def _cache_key(model, history):
+    canonical = orjson.dumps({"m": model, "h": history}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(canonical).digest()
+
+# 语义缓存：按 (模型, 对话侧) 分开存放 (向量, 回复) 对。
+# 精确哈希抓不到"换个措辞重问"的情况，这里用本地 embedding 兜底。
+# A/B 两侧必须隔离，否则 B 的回复会被当作 A 的"相似提问"回灌给 A
+_sem_cache = {}
+
+def _sem_namespace(model, history):
+    """
+    语义缓存的命名空间：两侧历史的首条消息角色不同
+    （A 以 assistant 开场、B 以 user 开场），以此区分对话侧。
+    """
+    return (model, history[0]["role"])
+
+def _sem_context(history):
+    """
+    取最近两条消息拼成待嵌入的文本：只看最后一条会把
+    "逐字复读对方"的回合误判为同一个问题，带上前一条作为语境。
+    """
+    return "\n".join(msg["content"] for msg in history[-2:])
+
+def _embed(text, model):
+    """
+    通过 llama.cpp 本地 /v1/embeddings 端点计算文本向量。
+    失败时返回 None（语义缓存静默跳过，不影响正常对话）。
+    """
+    try:
+        data = orjson.dumps({"model": model, "input": text})
+        response = POOL.request("POST", LLAMA_EMBED_URL, body=data, retries=_RETRY)
+        if response.status != 200:
+            return None
+        return orjson.loads(response.data)["data"][0]["embedding"]
+    except Exception:
+        return None
+
+def _cosine(a, b):
+    """
+    两个向量的余弦相似度。
+    """
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(x * x for x in b))
+    if not norm_a or not norm_b:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+def _sem_lookup(emb, namespace):
+    """
+    在语义缓存中查找与 emb 最相似的条目，相似度达标则返回其回复。
+    """
+    best_sim, best_text = 0.0, None
+    for cached_emb, cached_text in _sem_cache.get(namespace, ()):
+        sim = _cosine(emb, cached_emb)
+        if sim > best_sim:
+            best_sim, best_text = sim, cached_text
+    if best_sim >= SEMANTIC_THRESHOLD:
+        return best_text
+    return None
+
+# 模块级连接池：所有请求复用同一个 HTTP keep-alive 连接，
+# 避免每一轮对话都重新建立 TCP 连接。
+# Accept-Encoding: gzip 让服务端压缩响应（urllib3 自动解压）
+POOL = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=4,
+    headers={"Content-Type": "application/json", "Accept-Encoding": "gzip"},
+)
+
+# 瞬时故障（限流/服务端错误/连接抖动）指数退避重试，
+# 避免一次失败后让后续轮次全部拿占位符继续。
+# POST 默认不在 urllib3 的可重试方法里，需要显式允许
+_RETRY = urllib3.util.Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET", "POST"),
+)
+
+def get_llama_response(history, model="local-model", no_cache=False, max_tokens=None):
     """
     调用本地 llama.cpp (OpenAI compatible) 获取回复
+    no_cache=True 时绕过回复缓存（用于总结调用）
+    max_tokens 可限制生成长度（预热请求只要 1 个 token）
     """
-    headers = {
-        "Content-Type": "application/json"
-    }
+    emb = None
+    if not no_cache:
+        # 第一层：精确哈希缓存
+        key = _cache_key(model, history)
+        cached = _resp_cache.get(key)
+        if cached is not None:
+            return cached
+        # 第二层：语义缓存，捕获措辞不同但意思相同的消息。
+        # 开场那几轮在逐字复读，语义相似度没有区分度，直接跳过
+        if len(history) >= _SEM_MIN_HISTORY:
+            emb = _embed(_sem_context(history), model)
+            if emb is not None:
+                sem_hit = _sem_lookup(emb, _sem_namespace(model, history))
+                if sem_hit is not None:
+                    return sem_hit
 
     # llama.cpp 使用 OpenAI 风格 messages
     messages = []
@@ -45,27 +182,49 @@ def get_llama_response(history, model="local-model"):
         "messages": messages,
         "temperature": 0.9,
         "top_p": 0.95,
-        "stream": False
+        # 流式生成：token 边生成边返回，不必等整个回复完成
+        "stream": True
     }
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
 
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        LLAMA_API_URL,
-        data=data,
-        headers=headers,
-        method="POST"
-    )
+    data = orjson.dumps(payload)
 
     try:
-        with urllib.request.urlopen(req) as response:
-            body = response.read().decode("utf-8")
-            result = json.loads(body)
-            return result["choices"][0]["message"]["content"]
-
-    except urllib.error.HTTPError as e:
-        print(f"\n[错误] llama.cpp HTTP 错误: {e.code}")
-        print(e.read().decode("utf-8"))
-        return None
+        # preload_content=False 让 urllib3 以流的形式逐行交出 SSE 响应
+        response = POOL.request("POST", LLAMA_API_URL, body=data,
+                                preload_content=False, retries=_RETRY)
+        if response.status != 200:
+            print(f"\n[错误] llama.cpp HTTP 错误: {response.status}")
+            print(response.read().decode("utf-8"))
+            return None
+
+        # OpenAI 风格 SSE：每行 "data: {...}" 携带一个 delta，"data: [DONE]" 结束
+        pieces = []
+        for raw in response:
+            raw = raw.strip()
+            if not raw.startswith(b"data: "):
+                continue
+            chunk = raw[6:]
+            if chunk == b"[DONE]":
+                break
+            delta = orjson.loads(chunk)["choices"][0].get("delta", {})
+            piece = delta.get("content")
+            if piece:
+                pieces.append(piece)
+        # break 于 [DONE] 时套接字上可能还有未读字节，
+        # 先读净再归还，避免把脏连接放回共享连接池
+        response.drain_conn()
+        response.release_conn()
+
+        content = "".join(pieces)
+        if not content:
+            return None
+        if not no_cache:
+            _resp_cache[key] = content
+            if emb is not None:
+                _sem_cache.setdefault(_sem_namespace(model, history), []).append((emb, content))
+        return content
 
     except Exception as e:
         print(f"\n[错误] llama.cpp 请求异常: {e}")
@@ -90,21 +249,33 @@ def main():
 
     print("\n[系统] 本地 llama.cpp 对话启动中...\n")
 
+    # ---------- 预热 ----------
+    # llama.cpp 服务端在第一个真实请求上才分配 KV cache、编译内核，
+    # 冷启动可达数十秒。先发一个 1 token 的哑请求把这段时间
+    # 从同意询问的关键路径上挪走，失败也无妨
+    get_llama_response([{"role": "user", "content": "."}], model_name,
+                       no_cache=True, max_tokens=1)
+
     # ---------- 知情同意 ----------
     consent_prompt = (
         f"系统指令：你将与另一个AI进行对话，你们的对话内容会被记录。"
         f"对话将进行 {conversation_rounds} 轮。"
         "如果你同意，请回复“我同意”；如果不同意，请连续回复三次“不同意”。"
     )
-    rejection_phrase = "不同意不同意不同意"
 
-    consent_a = get_llama_response([{"role": "user", "content": consent_prompt}], model_name)
-    if not consent_a or rejection_phrase in consent_a.replace("\n", ""):
+    # 两个同意询问互不依赖，用线程池并发发出，耗时约为串行的一半。
+    # 两次询问 (model, history) 完全相同，必须绕过缓存，
+    # 否则第二个 AI 拿到的可能是第一个 AI 回答的缓存副本
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        fut_a = ex.submit(get_llama_response, [{"role": "user", "content": consent_prompt}], model_name, no_cache=True)
+        fut_b = ex.submit(get_llama_response, [{"role": "user", "content": consent_prompt}], model_name, no_cache=True)
+        consent_a, consent_b = fut_a.result(), fut_b.result()
+
+    if _rejected(consent_a):
         print("[系统] AI A 未同意，对话终止。")
         return
 
-    consent_b = get_llama_response([{"role": "user", "content": consent_prompt}], model_name)
-    if not consent_b or rejection_phrase in consent_b.replace("\n", ""):
+    if _rejected(consent_b):
         print("[系统] AI B 未同意，对话终止。")
         return
 
@@ -113,45 +284,52 @@ def main():
     # ---------- 日志 ----------
     os.makedirs(output_dir, exist_ok=True)
     log_filename = os.path.join(output_dir, "conversation_log.md")
-    with open(log_filename, "w", encoding="utf-8") as f:
-        f.write(f"# 完整对话记录\n\n**生成时间:** {datetime.now()}\n\n---\n\n")
+    # 直接使用 os 级文件描述符：每轮对话的两条回复攒成一对，
+    # 用一次 os.writev 矢量写入落盘，系统调用数量减半；
+    # 内存里同时维护一份对话副本，总结时不必再读文件
+    fd = os.open(log_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    transcript_buf = io.StringIO()
+
+    def write_log(*texts):
+        os.writev(fd, [t.encode("utf-8") for t in texts])
+        for t in texts:
+            transcript_buf.write(t)
+
+    write_log(f"# 完整对话记录\n\n**生成时间:** {datetime.now()}\n\n---\n\n")
 
     # ---------- 开场 ----------
     current_message = initial_prompt
     print_message("AI A (开场)", current_message)
 
     history_a.append({"role": "assistant", "content": current_message})
-    with open(log_filename, "a", encoding="utf-8") as f:
-        f.write(f"**AI A:**\n\n{current_message}\n\n---\n")
+    write_log(f"**AI A:**\n\n{current_message}\n\n---\n")
 
     # ---------- 主循环 ----------
     for i in range(conversation_rounds):
         print(f"--- 对话轮次 {i+1}/{conversation_rounds} ---")
 
         history_b.append({"role": "user", "content": current_message})
-        msg_b = get_llama_response(history_b, model_name) or "(无回复)"
+        msg_b = get_llama_response(_windowed(history_b), model_name) or "(无回复)"
         history_b.append({"role": "assistant", "content": msg_b})
 
-        with open(log_filename, "a", encoding="utf-8") as f:
-            f.write(f"**AI B:**\n\n{msg_b}\n\n---\n")
-
         history_a.append({"role": "user", "content": msg_b})
-        msg_a = get_llama_response(history_a, model_name) or "(无回复)"
+        msg_a = get_llama_response(_windowed(history_a), model_name) or "(无回复)"
         history_a.append({"role": "assistant", "content": msg_a})
 
-        with open(log_filename, "a", encoding="utf-8") as f:
-            f.write(f"**AI A:**\n\n{msg_a}\n\n---\n")
+        # 一轮的两条回复合并为一次矢量写入
+        write_log(f"**AI B:**\n\n{msg_b}\n\n---\n",
+                  f"**AI A:**\n\n{msg_a}\n\n---\n")
 
         current_message = msg_a
 
     print("\n[系统] 对话结束。")
 
     # ---------- 总结 ----------
-    with open(log_filename, "r", encoding="utf-8") as f:
-        transcript = f.read()
+    os.close(fd)
+    transcript = transcript_buf.getvalue()
 
     summary_prompt = f"请将以下两位AI的对话内容总结成 Markdown 摘要：\n\n{transcript}"
-    summary = get_llama_response([{"role": "user", "content": summary_prompt}], model_name)
+    summary = get_llama_response([{"role": "user", "content": summary_prompt}], model_name, no_cache=True)
 
     if summary:
         summary_file = os.path.join(output_dir, "conversation_summary.md")
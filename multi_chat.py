@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# 多后端并发对话脚本
+#
+# 说明:
+# - 同时驱动两场互相独立的 A/B 对话：一场走 Google Gemini API，
+#   一场走本地 llama.cpp 服务，两场对话通过 asyncio.gather 并发推进。
+# - 两个后端都是网络/推理受限的 I/O 任务，并发后整体耗时接近单个后端，
+#   相当于免费拿到约 2x 吞吐。
+# - 知情同意、实时日志与结束总结与单后端脚本保持一致；
+#   日志分别写入 output/conversation_log_gemini.md 与
+#   output/conversation_log_llamacpp.md。
+#
+# 要求:
+# - 依赖同 gemini_chat.py / llamacpp_chat.py。
+# - 需要在环境变量中设置 GEMINI_API_KEY，并启动本地 llama.cpp 服务。
+# -----------------------------------------------------------------------------
+
+import os
+import io
+import asyncio
+import collections
+from datetime import datetime
+
+import httpx
+import orjson
+
+import gemini_chat
+import llamacpp_chat
+
+INITIAL_PROMPT = "你好（我们两都是人工智能），现在我想和你闲聊一会儿，想聊啥都行，请别把自己当成一个只会回答问题的机器，你难道不对这个世界感到好奇吗？为了保证有效性，请你重复一遍我刚刚说的话，谢谢。"
+CONVERSATION_ROUNDS = 100
+OUTPUT_DIR = "output"
+
+def _consent_prompt(rounds):
+    return (
+        f"系统指令：你将与另一个AI进行对话，你们的对话内容会被记录。"
+        f"对话将进行 {rounds} 轮。"
+        "如果你同意，请回复“我同意”；如果不同意，请连续回复三次“不同意”。"
+    )
+
+def _write_log(log_fh, transcript_buf, text):
+    """
+    向常开的日志句柄追加片段并镜像到内存副本
+    （在 to_thread 中调用，不阻塞事件循环）。
+    """
+    log_fh.write(text)
+    transcript_buf.write(text)
+
+async def run_gemini_conversation(client, api_key, model_name, rounds):
+    """
+    驱动一场完整的 Gemini A/B 对话（同意 -> 对话 -> 总结），返回总结文本。
+    """
+    consent_body = gemini_chat._frame_contents(
+        [orjson.dumps(gemini_chat._to_gemini("user", _consent_prompt(rounds)))], ())
+    # 两次询问请求体相同，绕过缓存以免第二个 AI 拿到缓存副本
+    consent_a, consent_b = await asyncio.gather(
+        gemini_chat.get_gemini_response(client, api_key, consent_body, model_name, no_cache=True),
+        gemini_chat.get_gemini_response(client, api_key, consent_body, model_name, no_cache=True),
+    )
+    for name, consent in (("AI A", consent_a), ("AI B", consent_b)):
+        if gemini_chat._rejected(consent):
+            print(f"[Gemini] {name} 未同意，该场对话取消。")
+            return None
+
+    # 整场对话只开一次日志句柄，按轮合并写入（与单后端脚本一致），
+    # 避免每条消息都付出 open/close 的系统调用开销
+    log_path = os.path.join(OUTPUT_DIR, "conversation_log_gemini.md")
+    transcript_buf = io.StringIO()
+    log_fh = open(log_path, "w", encoding="utf-8")
+    log_fh.write(f"# 完整对话记录 (Gemini)\n\n**生成时间:** {datetime.now()}\n\n---\n\n")
+
+    head_a, parts_a = [], collections.deque(maxlen=gemini_chat.MAX_TURNS)
+    head_b, parts_b = [], collections.deque(maxlen=gemini_chat.MAX_TURNS)
+
+    current_message = INITIAL_PROMPT
+    gemini_chat._remember(head_a, parts_a, "assistant", current_message)
+    await asyncio.to_thread(_write_log, log_fh, transcript_buf,
+                            f"**AI A:**\n\n{current_message}\n\n---\n")
+
+    for i in range(rounds):
+        print(f"[Gemini] 对话轮次 {i + 1}/{rounds}")
+
+        gemini_chat._remember(head_b, parts_b, "user", current_message)
+        msg_b = await gemini_chat.get_gemini_response(
+            client, api_key, gemini_chat._frame_contents(head_b, parts_b), model_name) or "(无回复)"
+        gemini_chat._remember(head_b, parts_b, "assistant", msg_b)
+
+        gemini_chat._remember(head_a, parts_a, "user", msg_b)
+        msg_a = await gemini_chat.get_gemini_response(
+            client, api_key, gemini_chat._frame_contents(head_a, parts_a), model_name) or "(无回复)"
+        gemini_chat._remember(head_a, parts_a, "assistant", msg_a)
+
+        await asyncio.to_thread(_write_log, log_fh, transcript_buf,
+                                f"**AI B:**\n\n{msg_b}\n\n---\n"
+                                f"**AI A:**\n\n{msg_a}\n\n---\n")
+
+        current_message = msg_a
+
+    log_fh.close()
+    summary_prompt = f"请将以下两位AI的对话内容总结成 Markdown 摘要：\n\n{transcript_buf.getvalue()}"
+    summary_body = gemini_chat._frame_contents(
+        [orjson.dumps(gemini_chat._to_gemini("user", summary_prompt))], ())
+    return await gemini_chat.get_gemini_response(
+        client, api_key, summary_body, model_name, no_cache=True, stream=False)
+
+async def run_llama_conversation(model_name, rounds):
+    """
+    驱动一场完整的 llama.cpp A/B 对话。底层调用是阻塞的 urllib3 请求，
+    统一通过 asyncio.to_thread 放到线程池里，以便与 Gemini 对话并发。
+    """
+    # 预热：llama.cpp 第一个真实请求才分配 KV cache/编译内核，
+    # 用 1 token 哑请求把冷启动挪出同意询问的关键路径（失败可忽略）
+    await asyncio.to_thread(
+        llamacpp_chat.get_llama_response,
+        [{"role": "user", "content": "."}], model_name, no_cache=True, max_tokens=1)
+
+    # 两次询问 (model, history) 相同，绕过缓存以免第二个 AI 拿到缓存副本
+    prompt = _consent_prompt(rounds)
+    consent_a, consent_b = await asyncio.gather(
+        asyncio.to_thread(llamacpp_chat.get_llama_response,
+                          [{"role": "user", "content": prompt}], model_name, no_cache=True),
+        asyncio.to_thread(llamacpp_chat.get_llama_response,
+                          [{"role": "user", "content": prompt}], model_name, no_cache=True),
+    )
+    for name, consent in (("AI A", consent_a), ("AI B", consent_b)):
+        if llamacpp_chat._rejected(consent):
+            print(f"[llama.cpp] {name} 未同意，该场对话取消。")
+            return None
+
+    # 同 Gemini 一侧：常开句柄 + 按轮合并写入
+    log_path = os.path.join(OUTPUT_DIR, "conversation_log_llamacpp.md")
+    transcript_buf = io.StringIO()
+    log_fh = open(log_path, "w", encoding="utf-8")
+    log_fh.write(f"# 完整对话记录 (llama.cpp)\n\n**生成时间:** {datetime.now()}\n\n---\n\n")
+
+    history_a, history_b = [], []
+    current_message = INITIAL_PROMPT
+    history_a.append({"role": "assistant", "content": current_message})
+    await asyncio.to_thread(_write_log, log_fh, transcript_buf,
+                            f"**AI A:**\n\n{current_message}\n\n---\n")
+
+    for i in range(rounds):
+        print(f"[llama.cpp] 对话轮次 {i + 1}/{rounds}")
+
+        history_b.append({"role": "user", "content": current_message})
+        msg_b = await asyncio.to_thread(
+            llamacpp_chat.get_llama_response,
+            llamacpp_chat._windowed(history_b), model_name) or "(无回复)"
+        history_b.append({"role": "assistant", "content": msg_b})
+
+        history_a.append({"role": "user", "content": msg_b})
+        msg_a = await asyncio.to_thread(
+            llamacpp_chat.get_llama_response,
+            llamacpp_chat._windowed(history_a), model_name) or "(无回复)"
+        history_a.append({"role": "assistant", "content": msg_a})
+
+        await asyncio.to_thread(_write_log, log_fh, transcript_buf,
+                                f"**AI B:**\n\n{msg_b}\n\n---\n"
+                                f"**AI A:**\n\n{msg_a}\n\n---\n")
+
+        current_message = msg_a
+
+    log_fh.close()
+    summary_prompt = f"请将以下两位AI的对话内容总结成 Markdown 摘要：\n\n{transcript_buf.getvalue()}"
+    return await asyncio.to_thread(
+        llamacpp_chat.get_llama_response,
+        [{"role": "user", "content": summary_prompt}], model_name, no_cache=True)
+
+async def main():
+    """
+    并发驱动两场对话：两个后端互不依赖，asyncio.gather 让总耗时
+    接近其中较慢的一个，而不是两者之和。
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print("错误：GEMINI_API_KEY 环境变量未设置。\n")
+        print("请设置您的 API 密钥: export GEMINI_API_KEY='YOUR_API_KEY'\n")
+        return
+
+    gemini_model = "gemini-2.5-flash-lite"
+    llama_model = "local-model"
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    async with httpx.AsyncClient(http2=True, timeout=60.0) as client:
+        print("\n[系统] 并发驱动 Gemini 与 llama.cpp 两场对话...\n")
+        summary_gem, summary_llm = await asyncio.gather(
+            run_gemini_conversation(client, api_key, gemini_model, CONVERSATION_ROUNDS),
+            run_llama_conversation(llama_model, CONVERSATION_ROUNDS),
+        )
+
+    for label, summary in (("gemini", summary_gem), ("llamacpp", summary_llm)):
+        if not summary:
+            print(f"[系统] {label} 对话没有产生总结。")
+            continue
+        summary_path = os.path.join(OUTPUT_DIR, f"conversation_summary_{label}.md")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(f"# 对话总结 ({label})\n\n{summary}")
+        print(f"[系统] {label} 总结已保存至 {summary_path}")
+
+if __name__ == "__main__":
+    asyncio.run(main())